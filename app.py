@@ -5,10 +5,13 @@ import pandas as pd
 from datetime import datetime, timedelta
 from pymongo import MongoClient
 import os
+import logging
 from dotenv import load_dotenv
 import plotly.express as px
 import plotly.graph_objects as go
 from models.recommendation_engine import MovieRecommendationEngine
+from models.movie_catalog import MovieCatalog
+from models.resilience import BackgroundRefresher
 from utils.analysis import (
     analyze_preferences,
     create_genre_chart,
@@ -17,29 +20,15 @@ from utils.analysis import (
     create_language_chart,
     create_trend_chart,
     analyze_correlations,
-    create_correlation_chart
+    create_correlation_chart,
+    create_weighted_data
 )
-import time  # Import time for simulating progress
-import hashlib
-import json
-from bson import ObjectId  # Import ObjectId for type checking
+from utils.decay import load_preference_model, record_submission
+from utils.similarity import PreferenceIndex
+from utils.preferences import hash_preferences, convert_objectid_and_datetime
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
 
-# Function to hash preferences data
-def hash_preferences(preferences_data):
-    # Serialize the preferences data to a JSON string with sorted keys for consistency
-    preferences_str = json.dumps(preferences_data, sort_keys=True)
-    # Create a SHA256 hash of the string
-    return hashlib.sha256(preferences_str.encode()).hexdigest()
-
-# Function to convert ObjectId and datetime to string
-def convert_objectid_and_datetime(preferences):
-    """Converts ObjectId and datetime objects to strings in each document."""
-    for pref in preferences:
-        if '_id' in pref and isinstance(pref['_id'], ObjectId):
-            pref['_id'] = str(pref['_id'])
-        if 'timestamp' in pref and isinstance(pref['timestamp'], datetime):
-            pref['timestamp'] = pref['timestamp'].isoformat()
-    return preferences
+logger = logging.getLogger(__name__)
 
 # Page configuration
 st.set_page_config(
@@ -52,6 +41,15 @@ st.set_page_config(
 load_dotenv()
 MONGODB_URI = os.getenv("MONGODB_URI")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+MOVIE_CATALOG_PATH = os.getenv("MOVIE_CATALOG_PATH", "data/movie_catalog.db")
+PREFERENCE_HALF_LIFE_DAYS = float(os.getenv("PREFERENCE_HALF_LIFE_DAYS", "180"))
+
+# Seconds a page view waits for fresh recommendations when none are cached yet
+RECOMMENDATION_WAIT_SECONDS = 15
+# Overall time allowed for one background refresh, including retries
+RECOMMENDATION_LATENCY_BUDGET = 90
+# Seconds before a refresh that failed for the same preferences is tried again
+RECOMMENDATION_RETRY_SECONDS = 300
 
 # Initialize MongoDB connection
 @st.cache_resource
@@ -68,7 +66,9 @@ db = init_mongodb()
 # Initialize recommendation engine
 @st.cache_resource
 def init_engine():
-    return MovieRecommendationEngine(anthropic_api_key=ANTHROPIC_API_KEY)
+    # Use the local movie catalog when one has been imported
+    catalog = MovieCatalog(MOVIE_CATALOG_PATH) if os.path.exists(MOVIE_CATALOG_PATH) else None
+    return MovieRecommendationEngine(anthropic_api_key=ANTHROPIC_API_KEY, catalog=catalog)
 
 engine = init_engine()
 
@@ -99,6 +99,25 @@ MOODS = [
     "Romantic", "Nostalgic"
 ]
 
+PREFERENCE_OPTIONS = {
+    "genres": GENRES,
+    "time_periods": TIME_PERIODS,
+    "languages": LANGUAGES,
+    "quality_markers": QUALITY_MARKERS,
+    "moods": MOODS
+}
+
+# Initialize "members like me" index, kept current by inserts from this process
+@st.cache_resource
+def init_preference_index():
+    index = PreferenceIndex(PREFERENCE_OPTIONS)
+    if db is not None:
+        projection = {"name": 1, **{field: 1 for field in PREFERENCE_OPTIONS}}
+        index.build(db.preferences.find({}, projection))
+    return index
+
+preference_index = init_preference_index()
+
 # Load custom CSS
 def load_css():
     try:
@@ -143,11 +162,46 @@ with st.sidebar:
 
         st.metric("Total Entries", total_entries)
         st.metric("New This Week", recent_entries)
+    
+    favor_recent = st.toggle(
+        "Favor recent preferences",
+        help=f"Weight each submission by age, halving every {PREFERENCE_HALF_LIFE_DAYS:g} days"
+    )
+
+# Background refreshes of group recommendations, shared by all sessions
+@st.cache_resource
+def init_refresher():
+    return BackgroundRefresher()
+
+refresher = init_refresher()
 
-# Caching function for group recommendations based on the hash
-@st.cache_data(show_spinner=False)
-def get_group_recommendations(preferences_hash, _preferences_data):
-    return engine.generate_group_recommendations(_preferences_data)
+def refresh_group_recommendations(slot, preferences_key, preferences_data, group_analysis=None):
+    """Generate group recommendations and keep them as the last good result for their slot"""
+    recommendations = engine.generate_group_recommendations(
+        preferences_data,
+        group_analysis=group_analysis,
+        latency_budget=RECOMMENDATION_LATENCY_BUDGET
+    )
+    # Only store the outcome if no newer preferences were requested meanwhile
+    if "markdown" in recommendations:
+        db.recommendations.update_one(
+            {"_id": slot, "requested_key": preferences_key},
+            {
+                "$set": {
+                    "markdown": recommendations["markdown"],
+                    "preferences_key": preferences_key,
+                    "generated_at": datetime.now()
+                },
+                "$unset": {"failed_key": "", "failed_at": ""}
+            }
+        )
+    else:
+        # Remember the failure, so page views don't retry it on every rerun
+        db.recommendations.update_one(
+            {"_id": slot, "requested_key": preferences_key},
+            {"$set": {"failed_key": preferences_key, "failed_at": datetime.now()}}
+        )
+    return recommendations
 
 # Main content
 if selected == "Submit Preferences":
@@ -192,7 +246,22 @@ if selected == "Submit Preferences":
                         }
                         
                         # Save to MongoDB
-                        db.preferences.insert_one(preference)
+                        result = db.preferences.insert_one(preference)
+                        
+                        # Index the submission and look up members with similar taste
+                        member_key = str(result.inserted_id)
+                        preference_index.add(member_key, preference)
+                        st.session_state["similar_members"] = preference_index.query(
+                            preference, k=5, exclude_key=member_key, exclude_name=name
+                        )
+                        
+                        # Apply the submission to the time-decayed group model; the
+                        # preference is already saved, and a failed update is rebuilt on next load
+                        try:
+                            record_submission(db, preference, PREFERENCE_HALF_LIFE_DAYS)
+                        except Exception:
+                            logger.exception("Failed to update the time-decayed preference model.")
+                        
                         st.success("Thank you! Your preferences have been saved.")
                         st.balloons()
                         
@@ -201,6 +270,17 @@ if selected == "Submit Preferences":
                         
                     except Exception as e:
                         st.error(f"Error saving preferences: {str(e)}")
+    
+    # Members like you, from the most recent submission in this session
+    similar_members = st.session_state.get("similar_members")
+    if similar_members:
+        st.markdown("### Members Like You")
+        for member in similar_members:
+            new_options = [option for options in member["new_options"].values() for option in options]
+            line = f"**{member['name']}** · {member['similarity']:.0%} match"
+            if new_options:
+                line += f"  \nAlso enjoys: {', '.join(new_options)}"
+            st.markdown(line)
 
 elif selected == "View Analysis":
     st.title("Group Preferences Analysis")
@@ -226,6 +306,18 @@ elif selected == "View Analysis":
         time_data = analysis_results["time_data"]
         lang_data = analysis_results["language_data"]
         trends = analysis_results["trends"]
+        
+        if favor_recent:
+            # Replace raw counts with time-decayed weights
+            model = load_preference_model(db, PREFERENCE_HALF_LIFE_DAYS)
+            weighted_counts = model.weighted_counts()
+            effective_members = model.effective_members()
+            genre_data = create_weighted_data(weighted_counts["genres"], "Genre", effective_members)
+            mood_data = create_weighted_data(weighted_counts["moods"], "Mood", effective_members)
+            time_data = create_weighted_data(weighted_counts["time_periods"], "Period", effective_members)
+            lang_data = create_weighted_data(weighted_counts["languages"], "Language", effective_members)
+            st.caption(f"Weighted by recency: submissions count half as much every {PREFERENCE_HALF_LIFE_DAYS:g} days.")
+        
         corr_matrix = analyze_correlations(preferences)
         
         # Overview Metrics
@@ -291,34 +383,72 @@ elif selected == "Get Recommendations":
     if not preferences_data:
         st.warning("No preferences found. Please submit preferences first.")
     else:
-        with st.container():
-            progress_placeholder = st.empty()
-            status_placeholder = st.empty()
-            progress_bar = progress_placeholder.progress(0)
-            status_messages = ["Analyzing preferences...", "Generating recommendations...", "Finalizing..."]
-            for i, message in enumerate(status_messages):
-                status_placeholder.text(message)
-                progress_bar.progress((i + 1) / len(status_messages))
-                time.sleep(1)  # Simulate processing time
+        # Equal and recency-weighted recommendations are cached separately
+        slot = "group-decayed" if favor_recent else "group-equal"
+        preferences_key = hash_preferences(preferences_data)
+        group_analysis = load_preference_model(db, PREFERENCE_HALF_LIFE_DAYS).analysis() if favor_recent else None
         
-            try:
-                st.write("🎬 Finding the perfect movies for your group...")
-                
-                # Compute the hash of preferences_data
-                preferences_hash = hash_preferences(preferences_data)
-                
-                # Generate group recommendations (cached)
-                recommendations = get_group_recommendations(preferences_hash, preferences_data)
+        # Last good recommendations, served immediately even when out of date
+        cached = db.recommendations.find_one({"_id": slot}) or {}
+        
+        if cached.get("markdown") and cached.get("preferences_key") == preferences_key:
+            st.markdown(cached["markdown"], unsafe_allow_html=True)
+        else:
+            # Don't retry while the service is failing: the circuit is open, or these
+            # preferences failed recently
+            recently_failed = (
+                cached.get("failed_key") == preferences_key
+                and datetime.now() - cached["failed_at"] < timedelta(seconds=RECOMMENDATION_RETRY_SECONDS)
+            )
+            unavailable = recently_failed or engine.breaker.state == "open"
+            
+            if not unavailable:
+                # Mark these preferences as the newest request, so older refreshes can't overwrite them
+                db.recommendations.update_one(
+                    {"_id": slot},
+                    {"$set": {"requested_key": preferences_key, "requested_at": datetime.now()}},
+                    upsert=True
+                )
+                refresh = refresher.submit(
+                    slot, preferences_key,
+                    refresh_group_recommendations, slot, preferences_key, preferences_data, group_analysis
+                )
+            
+            if cached.get("markdown"):
+                if unavailable:
+                    st.warning(
+                        f"Showing recommendations from {cached['generated_at']:%Y-%m-%d %H:%M}. "
+                        "The recommendation service is temporarily unavailable, so they don't reflect "
+                        "the latest preferences yet; please check back later."
+                    )
+                else:
+                    st.info(
+                        f"Showing recommendations from {cached['generated_at']:%Y-%m-%d %H:%M}. "
+                        "Updated picks for the latest preferences are on their way; check back shortly."
+                    )
+                st.markdown(cached["markdown"], unsafe_allow_html=True)
+            elif unavailable:
+                st.error("The recommendation service is temporarily unavailable. Please try again in a few minutes.")
+            else:
+                # Nothing to fall back on yet, so wait for the refresh within the page budget
+                with st.spinner("🎬 Finding the perfect movies for your group..."):
+                    try:
+                        recommendations = refresh.result(timeout=RECOMMENDATION_WAIT_SECONDS)
+                    except (FutureTimeoutError, CancelledError):
+                        recommendations = None
+                    except Exception as e:
+                        recommendations = {"error": f"Error: {str(e)}"}
                 
-                if "error" in recommendations:
+                if recommendations is None:
+                    st.info("Your recommendations are still being prepared. Check back in a moment.")
+                    st.button("Check Again")
+                elif "error" in recommendations:
                     st.error(recommendations["error"])
-                    st.text_area("Raw Response", recommendations["raw_response"], height=200)
+                    if recommendations.get("raw_response"):
+                        with st.expander("Raw Response"):
+                            st.text(recommendations["raw_response"])
                 else:
-                    # Display recommendations in Markdown
                     st.markdown(recommendations["markdown"], unsafe_allow_html=True)
-                
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,236 @@
+# batch_jobs.py
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+
+from models.movie_catalog import MovieCatalog
+from models.recommendation_engine import MovieRecommendationEngine
+from utils.decay import load_preference_model
+from utils.preferences import convert_objectid_and_datetime, hash_preferences
+
+logger = logging.getLogger(__name__)
+
+# Seconds between batch status checks
+POLL_INTERVAL = 30
+
+
+class RecommendationBatchJob:
+    """Bulk recommendation generation through the Message Batches API.
+
+    The batch ID is stored in the batch_jobs collection as soon as the batch
+    is created, so an interrupted job resumes polling the same batch instead
+    of submitting (and paying for) a new one. Results are upserted by
+    custom_id, so collecting the same batch twice is harmless.
+
+    A request may carry the preferences_key of the preferences it was built
+    from. The key is stored with the job and written with the result, and the
+    result is skipped when the app has requested newer preferences since.
+    """
+
+    def __init__(self, engine: MovieRecommendationEngine, jobs_db, job_id: str, poll_interval: float = POLL_INTERVAL):
+        self.engine = engine
+        self.jobs = jobs_db.batch_jobs
+        self.job_id = job_id
+        self.poll_interval = poll_interval
+
+    @property
+    def batches(self):
+        # Offline jobs have no latency budget, so let the client retry transient errors
+        return self.engine.anthropic.with_options(max_retries=2).messages.batches
+
+    def run(self, build_requests, resolve_target) -> Dict:
+        """Submit (or resume) the batch, wait for it to end and persist the results.
+
+        build_requests() returns the batch requests and is only called when a
+        new batch is needed; resolve_target(custom_id) returns the
+        (collection, document id) a result is written to.
+        """
+
+        job = self.jobs.find_one({"_id": self.job_id})
+        if job is not None and job["status"] != "completed":
+            logger.info(f"Resuming job {self.job_id} with batch {job['batch_id']}")
+            batch_id = job["batch_id"]
+            preferences_keys = job.get("preferences_keys", {})
+            requested_at = job.get("requested_at")
+        else:
+            # Preferences read after this moment are at least as new as the batch's
+            requested_at = datetime.now()
+            requests = build_requests()
+            if not requests:
+                logger.info(f"Nothing to submit for job {self.job_id}")
+                return {"batch_id": None, "succeeded": 0, "failed": 0}
+
+            preferences_keys = {
+                request["custom_id"]: request["preferences_key"]
+                for request in requests
+                if "preferences_key" in request
+            }
+            batch = self.batches.create(requests=[
+                {"custom_id": request["custom_id"], "params": request["params"]} for request in requests
+            ])
+            batch_id = batch.id
+            self.jobs.replace_one(
+                {"_id": self.job_id},
+                {
+                    "_id": self.job_id,
+                    "batch_id": batch_id,
+                    "status": "submitted",
+                    "request_count": len(requests),
+                    "preferences_keys": preferences_keys,
+                    "requested_at": requested_at,
+                    "created_at": datetime.now()
+                },
+                upsert=True
+            )
+            logger.info(f"Submitted batch {batch_id} with {len(requests)} requests")
+
+        self._wait(batch_id)
+        summary = self._collect(batch_id, resolve_target, preferences_keys, requested_at)
+
+        self.jobs.update_one(
+            {"_id": self.job_id},
+            {"$set": {"status": "completed", "completed_at": datetime.now(), **summary}}
+        )
+        return {"batch_id": batch_id, **summary}
+
+    def _wait(self, batch_id: str) -> None:
+        while True:
+            batch = self.batches.retrieve(batch_id)
+            if batch.processing_status == "ended":
+                return
+            logger.info(f"Batch {batch_id} is {batch.processing_status}; checking again in {self.poll_interval}s")
+            time.sleep(self.poll_interval)
+
+    def _collect(self, batch_id: str, resolve_target, preferences_keys: Dict[str, str], requested_at: Optional[datetime]) -> Dict:
+        succeeded = 0
+        failed = 0
+
+        for entry in self.batches.results(batch_id):
+            collection, document_id = resolve_target(entry.custom_id)
+
+            if entry.result.type == "succeeded":
+                recommendations = self.engine.parse_response(
+                    entry.result.message.content[0].text,
+                    "Failed to extract Markdown recommendations"
+                )
+            else:
+                error = getattr(entry.result, "error", None)
+                recommendations = {
+                    "error": f"Batch request {entry.result.type}: {error}" if error else f"Batch request {entry.result.type}",
+                    "raw_response": ""
+                }
+
+            if "error" in recommendations:
+                # Keep whatever good result is already stored
+                failed += 1
+                logger.warning(f"{entry.custom_id}: {recommendations['error']}")
+                continue
+
+            succeeded += 1
+            update = {"$set": {**recommendations, "batch_id": batch_id, "generated_at": datetime.now()}}
+            preferences_key = preferences_keys.get(entry.custom_id)
+            if preferences_key is None:
+                collection.update_one({"_id": document_id}, update, upsert=True)
+                continue
+
+            # Like the app's own refreshes, only write if no newer preferences were requested
+            # meanwhile, and claim the request so older in-flight refreshes can't overwrite it
+            update["$set"].update({"preferences_key": preferences_key, "requested_key": preferences_key})
+            update["$max"] = {"requested_at": requested_at}
+            try:
+                collection.update_one(
+                    {
+                        "_id": document_id,
+                        "$or": [
+                            {"requested_at": {"$exists": False}},
+                            {"requested_key": preferences_key},
+                            {"requested_at": {"$lte": requested_at}}
+                        ]
+                    },
+                    update,
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                # The document exists but newer preferences were requested; the app refreshes it
+                logger.info(f"{entry.custom_id}: newer preferences were requested; keeping the app's result")
+
+        return {"succeeded": succeeded, "failed": failed}
+
+
+def personal_requests(engine: MovieRecommendationEngine, db) -> List[Dict]:
+    """One personal recommendation request per member"""
+    return [
+        {"custom_id": f"personal-{pref['_id']}", "params": engine.personal_message_params(pref)}
+        for pref in db.preferences.find()
+    ]
+
+
+def group_requests(engine: MovieRecommendationEngine, client, club_dbs: List[str], half_life_days: Optional[float]) -> List[Dict]:
+    """One group recommendation request per club database, with the key of the preferences it covers"""
+    requests = []
+    for name in club_dbs:
+        db = client[name]
+        # Converted and keyed exactly as the app does, so the app recognizes the result as current
+        preferences = convert_objectid_and_datetime(list(db.preferences.find()))
+        if not preferences:
+            continue
+        group_analysis = load_preference_model(db, half_life_days).analysis() if half_life_days else None
+        requests.append({
+            "custom_id": f"group-{name}",
+            "params": engine.group_message_params(preferences, group_analysis),
+            "preferences_key": hash_preferences(preferences)
+        })
+    return requests
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description="Generate recommendations in bulk with the Message Batches API")
+    parser.add_argument("kind", choices=["personal", "group"], help="Personal recommendations for every member, or group recommendations per club")
+    parser.add_argument("--db", action="append", dest="dbs", help="Club database (repeatable for group jobs; default movie_preferences)")
+    parser.add_argument("--job-id", help="Name of the job to start or resume (default derived from kind and databases)")
+    parser.add_argument("--favor-recent", action="store_true", help="Use time-decayed group preferences")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="Seconds between status checks")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGODB_URI"))
+    catalog_path = os.getenv("MOVIE_CATALOG_PATH", "data/movie_catalog.db")
+    catalog = MovieCatalog(catalog_path) if os.path.exists(catalog_path) else None
+    engine = MovieRecommendationEngine(anthropic_api_key=os.getenv("ANTHROPIC_API_KEY"), catalog=catalog)
+
+    dbs = args.dbs or ["movie_preferences"]
+    jobs_db = client[dbs[0]]
+    job_id = args.job_id or f"{args.kind}-{'-'.join(dbs)}"
+    job = RecommendationBatchJob(engine, jobs_db, job_id, poll_interval=args.poll_interval)
+
+    if args.kind == "personal":
+        if len(dbs) != 1:
+            parser.error("personal jobs take a single --db")
+        db = client[dbs[0]]
+        summary = job.run(
+            lambda: personal_requests(engine, db),
+            lambda custom_id: (db.recommendations, custom_id)
+        )
+    else:
+        half_life_days = float(os.getenv("PREFERENCE_HALF_LIFE_DAYS", "180")) if args.favor_recent else None
+        # Same per-weighting documents the app serves as its last good recommendations
+        slot = "group-decayed" if args.favor_recent else "group-equal"
+        summary = job.run(
+            lambda: group_requests(engine, client, dbs, half_life_days),
+            lambda custom_id: (client[custom_id[len("group-"):]].recommendations, slot)
+        )
+
+    logger.info(f"Job {job_id} finished: {summary}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
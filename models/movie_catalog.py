@@ -0,0 +1,145 @@
+# movie_catalog.py
+
+import json
+import logging
+import sqlite3
+import sys
+from contextlib import closing
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# Tag fields, matching the preference fields members choose from
+TAG_FIELDS = ["genres", "moods", "time_periods", "languages", "quality_markers"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    year INTEGER,
+    synopsis TEXT NOT NULL DEFAULT ''
+);
+
+-- A plain UNIQUE (title, year) treats NULL years as distinct, so map them to -1
+CREATE UNIQUE INDEX IF NOT EXISTS movies_by_title_year ON movies (title, IFNULL(year, -1));
+
+-- Inverted index: (field, tag) -> movie ids, clustered on the lookup key
+CREATE TABLE IF NOT EXISTS movie_tags (
+    field TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    movie_id INTEGER NOT NULL REFERENCES movies (id) ON DELETE CASCADE,
+    PRIMARY KEY (field, tag, movie_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS movie_tags_by_movie ON movie_tags (movie_id);
+"""
+
+
+class MovieCatalog:
+    """Local SQLite catalog of films the club can show, indexed by preference tags"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call keeps the catalog safe to share across sessions
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def count(self) -> int:
+        """Number of films in the catalog"""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
+
+    def import_movies(self, movies: Iterable[Dict]) -> int:
+        """Insert or update films along with their tags"""
+
+        imported = 0
+        with closing(self._connect()) as conn, conn:
+            for movie in movies:
+                conn.execute(
+                    "INSERT INTO movies (title, year, synopsis) VALUES (?, ?, ?) "
+                    "ON CONFLICT (title, IFNULL(year, -1)) DO UPDATE SET synopsis = excluded.synopsis",
+                    (movie["title"], movie.get("year"), movie.get("synopsis", ""))
+                )
+                movie_id = conn.execute(
+                    "SELECT id FROM movies WHERE title = ? AND IFNULL(year, -1) = IFNULL(?, -1)",
+                    (movie["title"], movie.get("year"))
+                ).fetchone()[0]
+
+                conn.execute("DELETE FROM movie_tags WHERE movie_id = ?", (movie_id,))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO movie_tags (field, tag, movie_id) VALUES (?, ?, ?)",
+                    [(field, tag, movie_id) for field in TAG_FIELDS for tag in movie.get(field, [])]
+                )
+                imported += 1
+
+        return imported
+
+    def score_candidates(self, weights: Dict[str, Dict[str, float]], limit: int = 25) -> List[Dict]:
+        """Rank films by the summed weight of their matching tags"""
+
+        weight_rows = [
+            (field, tag, float(weight))
+            for field in TAG_FIELDS
+            for tag, weight in weights.get(field, {}).items()
+            if weight > 0
+        ]
+        if not weight_rows:
+            return []
+
+        placeholders = ", ".join(["(?, ?, ?)"] * len(weight_rows))
+        params = [value for row in weight_rows for value in row]
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"""
+                WITH weights (field, tag, weight) AS (VALUES {placeholders})
+                SELECT m.id, m.title, m.year, m.synopsis, SUM(w.weight) AS score
+                FROM weights w
+                JOIN movie_tags t ON t.field = w.field AND t.tag = w.tag
+                JOIN movies m ON m.id = t.movie_id
+                GROUP BY m.id
+                ORDER BY score DESC, m.title
+                LIMIT ?
+                """,
+                params + [limit]
+            ).fetchall()
+
+            candidates = {
+                movie_id: {"title": title, "year": year, "synopsis": synopsis, "score": score, "tags": {}}
+                for movie_id, title, year, synopsis, score in rows
+            }
+            if candidates:
+                id_placeholders = ", ".join(["?"] * len(candidates))
+                for field, tag, movie_id in conn.execute(
+                    f"SELECT field, tag, movie_id FROM movie_tags WHERE movie_id IN ({id_placeholders})",
+                    list(candidates)
+                ):
+                    candidates[movie_id]["tags"].setdefault(field, []).append(tag)
+
+        return list(candidates.values())
+
+
+def main(argv: List[str]) -> None:
+    """Import films from a JSON file: python -m models.movie_catalog CATALOG_DB MOVIES_JSON"""
+
+    if len(argv) != 2:
+        print(main.__doc__)
+        sys.exit(1)
+
+    catalog_path, movies_path = argv
+    with open(movies_path, encoding="utf-8") as f:
+        movies = json.load(f)
+
+    catalog = MovieCatalog(catalog_path)
+    imported = catalog.import_movies(movies)
+    logger.info(f"Imported {imported} films; catalog now holds {catalog.count()}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
@@ -1,52 +1,87 @@
 # recommendation_engine.py
 
 import logging
+import random
+import sqlite3
+import time
 from typing import List, Dict, Optional
-from anthropic import Anthropic
+from anthropic import Anthropic, APIConnectionError, APIStatusError
+from models.movie_catalog import MovieCatalog
+from models.resilience import CircuitBreaker, CircuitOpenError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class MovieRecommendationEngine:
-    """Movie recommendation engine using Anthropic's Claude API"""
+MODEL = "claude-3-5-sonnet-20241022"
 
-    def __init__(self, anthropic_api_key: str):
-        self.anthropic = Anthropic(api_key=anthropic_api_key)
+# Output budgets: writing full descriptions vs. ranking a catalog shortlist
+FULL_MAX_TOKENS = 3000
+SHORTLIST_MAX_TOKENS = 1800
 
-    def generate_group_recommendations(self, preferences_data: List[Dict]) -> Dict:
-        """Generate movie recommendations based on group preferences"""
+# Number of catalog candidates sent to Claude
+GROUP_SHORTLIST_SIZE = 25
+PERSONAL_SHORTLIST_SIZE = 15
 
-        # Analyze group preferences
-        group_analysis = self._analyze_group_preferences(preferences_data)
+# Films each shortlist prompt asks for; fewer matching catalog films fall back to open recommendations
+GROUP_SHORTLIST_PICKS = 5 + 3 + 3
+PERSONAL_SHORTLIST_PICKS = 3 + 3 + 3
 
-        prompt = self._create_group_prompt(group_analysis)
+# Retries with exponential backoff (seconds) for transient API failures
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 8.0
 
-        try:
-            response = self.anthropic.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=3000,  # Increased token limit to accommodate detailed Markdown
-                temperature=0.7,
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }]
-            )
+# Per-attempt timeout when the caller sets no latency budget
+REQUEST_TIMEOUT = 120.0
 
-            response_text = response.content[0].text.strip()
+# Per-movie details requested when Claude describes films from scratch
+FULL_MOVIE_DETAILS = """For each movie, include:
+- **Title and Year**
+- **Genres**
+- **Brief Description**
+- **Match Score (0-100)**
+- **Selling Points** (bullet list of 3 items)
+- **Explanation** of why it's recommended"""
 
-            # Extract Markdown content from the response
-            markdown_content = self._extract_markdown(response_text)
+# Per-movie details when Claude picks from catalog films, whose synopses it condenses
+SHORTLIST_MOVIE_DETAILS = """Only recommend films from the list above, each film at most once. For each movie, include:
+- **Title and Year**
+- **Brief Description** (one sentence, based on its synopsis above)
+- **Match Score (0-100)**
+- **Explanation** of why it's recommended (one or two sentences)"""
 
-            if markdown_content:
-                return {
-                    "markdown": markdown_content
-                }
-            else:
-                return {
-                    "error": "Failed to extract Markdown recommendations",
-                    "raw_response": response_text
-                }
+class MovieRecommendationEngine:
+    """Movie recommendation engine using Anthropic's Claude API"""
+
+    def __init__(
+        self,
+        anthropic_api_key: str,
+        catalog: Optional[MovieCatalog] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        # Retries are handled here, within the caller's latency budget
+        self.anthropic = Anthropic(api_key=anthropic_api_key, max_retries=0)
+        self.catalog = catalog
+        self.breaker = breaker or CircuitBreaker()
+
+    def generate_group_recommendations(
+        self,
+        preferences_data: List[Dict],
+        group_analysis: Optional[Dict] = None,
+        latency_budget: Optional[float] = None
+    ) -> Dict:
+        """Generate movie recommendations based on group preferences"""
+
+        params = self.group_message_params(preferences_data, group_analysis)
+
+        try:
+            response = self._create_message(params, latency_budget)
+
+            return self.parse_response(
+                response.content[0].text,
+                "Failed to extract Markdown recommendations"
+            )
 
         except Exception as e:
             logger.exception("Exception occurred while generating group recommendations.")
@@ -55,36 +90,23 @@ class MovieRecommendationEngine:
                 "raw_response": ""
             }
 
-    def generate_personal_recommendations(self, user_preferences: Dict) -> Dict:
+    def generate_personal_recommendations(
+        self,
+        user_preferences: Dict,
+        similar_members: Optional[List[Dict]] = None,
+        latency_budget: Optional[float] = None
+    ) -> Dict:
         """Generate personalized movie recommendations"""
 
-        prompt = self._create_personal_prompt(user_preferences)
+        params = self.personal_message_params(user_preferences, similar_members)
 
         try:
-            response = self.anthropic.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=3000,  # Increased token limit
-                temperature=0.7,
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }]
-            )
-
-            response_text = response.content[0].text.strip()
+            response = self._create_message(params, latency_budget)
 
-            # Extract Markdown content from the response
-            markdown_content = self._extract_markdown(response_text)
-
-            if markdown_content:
-                return {
-                    "markdown": markdown_content
-                }
-            else:
-                return {
-                    "error": "Failed to extract Markdown personal recommendations",
-                    "raw_response": response_text
-                }
+            return self.parse_response(
+                response.content[0].text,
+                "Failed to extract Markdown personal recommendations"
+            )
 
         except Exception as e:
             logger.exception("Exception occurred while generating personal recommendations.")
@@ -93,6 +115,119 @@ class MovieRecommendationEngine:
                 "raw_response": ""
             }
 
+    def _create_message(self, params: Dict, latency_budget: Optional[float] = None):
+        """Call the Messages API with retries, a circuit breaker and an overall deadline"""
+
+        deadline = time.monotonic() + latency_budget if latency_budget else None
+
+        for attempt in range(MAX_ATTEMPTS):
+            # Check the budget first: allow() may claim the half-open trial call
+            timeout = deadline - time.monotonic() if deadline else REQUEST_TIMEOUT
+            if timeout <= 0:
+                raise TimeoutError("Latency budget exhausted")
+
+            if not self.breaker.allow():
+                raise CircuitOpenError("Recommendation service is temporarily unavailable")
+
+            # Every exit after allow() must report an outcome, or a half-open trial is never released
+            transient_error = None
+            outcome_recorded = False
+            try:
+                response = self.anthropic.messages.create(**params, timeout=timeout)
+            except Exception as e:
+                if not self._is_transient(e):
+                    # The service answered; this is a problem with the request, not an outage
+                    self.breaker.record_success()
+                    outcome_recorded = True
+                    raise
+                self.breaker.record_failure()
+                outcome_recorded = True
+                transient_error = e
+            else:
+                self.breaker.record_success()
+                outcome_recorded = True
+                return response
+            finally:
+                if not outcome_recorded:
+                    self.breaker.record_failure()
+
+            # Full jitter keeps concurrent sessions from retrying in lockstep
+            backoff = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            if attempt == MAX_ATTEMPTS - 1 or (deadline and time.monotonic() + backoff >= deadline):
+                raise transient_error
+            logger.warning(f"Transient API error ({transient_error}); retrying in {backoff:.1f}s")
+            time.sleep(backoff)
+
+    def _is_transient(self, error: Exception) -> bool:
+        """Timeouts, connection errors, rate limits and server errors are worth retrying"""
+        if isinstance(error, APIConnectionError):
+            return True
+        return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+    def group_message_params(
+        self,
+        preferences_data: List[Dict],
+        group_analysis: Optional[Dict] = None
+    ) -> Dict:
+        """Build Messages API parameters for group recommendations"""
+
+        # Analyze group preferences, unless a precomputed (e.g. time-decayed) analysis is given
+        if group_analysis is None:
+            group_analysis = self._analyze_group_preferences(preferences_data)
+
+        # Pre-score catalog films so Claude only ranks and justifies a shortlist
+        shortlist = self._shortlist(group_analysis, GROUP_SHORTLIST_SIZE, GROUP_SHORTLIST_PICKS)
+
+        prompt = self._create_group_prompt(group_analysis, shortlist)
+
+        return self._message_params(prompt, SHORTLIST_MAX_TOKENS if shortlist else FULL_MAX_TOKENS)
+
+    def personal_message_params(
+        self,
+        user_preferences: Dict,
+        similar_members: Optional[List[Dict]] = None
+    ) -> Dict:
+        """Build Messages API parameters for personal recommendations"""
+
+        shortlist = self._shortlist(
+            self._personal_weights(user_preferences, similar_members or []),
+            PERSONAL_SHORTLIST_SIZE,
+            PERSONAL_SHORTLIST_PICKS
+        )
+
+        prompt = self._create_personal_prompt(user_preferences, similar_members, shortlist)
+
+        return self._message_params(prompt, SHORTLIST_MAX_TOKENS if shortlist else FULL_MAX_TOKENS)
+
+    def parse_response(self, response_text: str, error_message: str) -> Dict:
+        """Turn Claude's reply into a recommendations result"""
+
+        response_text = response_text.strip()
+
+        # Extract Markdown content from the response
+        markdown_content = self._extract_markdown(response_text)
+
+        if markdown_content:
+            return {
+                "markdown": markdown_content
+            }
+        else:
+            return {
+                "error": error_message,
+                "raw_response": response_text
+            }
+
+    def _message_params(self, prompt: str, max_tokens: int) -> Dict:
+        return {
+            "model": MODEL,
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "messages": [{
+                "role": "user",
+                "content": prompt
+            }]
+        }
+
     def _analyze_group_preferences(self, preferences_data: List[Dict]) -> Dict:
         """Analyze and summarize group preferences"""
 
@@ -152,7 +287,56 @@ class MovieRecommendationEngine:
 
         return analysis
 
-    def _create_group_prompt(self, analysis: Dict) -> str:
+    def _personal_weights(self, preferences: Dict, similar_members: List[Dict]) -> Dict:
+        """Weight a member's own choices, plus lighter weight for options similar members enjoy"""
+
+        weights = {}
+        for field in ('genres', 'moods', 'time_periods', 'quality_markers', 'languages'):
+            weights[field] = {option: 1.0 for option in preferences.get(field, [])}
+
+        for member in similar_members:
+            for field, options in member.get('new_options', {}).items():
+                for option in options:
+                    field_weights = weights.setdefault(field, {})
+                    field_weights[option] = field_weights.get(option, 0) + 0.5 * member.get('similarity', 0)
+
+        return weights
+
+    def _shortlist(self, weights: Dict, limit: int, minimum: int) -> List[Dict]:
+        """Return the best-matching catalog films, or an empty list when there aren't enough to pick from"""
+
+        if self.catalog is None:
+            return []
+
+        try:
+            shortlist = self.catalog.score_candidates(weights, limit=limit)
+        except sqlite3.Error:
+            logger.exception("Failed to score catalog candidates; falling back to open recommendations.")
+            return []
+
+        if len(shortlist) < minimum:
+            logger.info(f"Only {len(shortlist)} catalog films match, {minimum} needed; falling back to open recommendations.")
+            return []
+
+        return shortlist
+
+    def _format_shortlist(self, shortlist: List[Dict]) -> str:
+        """Format catalog candidates as compact prompt lines"""
+
+        lines = []
+        for movie in shortlist:
+            tags = movie['tags']
+            tag_text = "; ".join(
+                f"{label}: {', '.join(tags[field])}"
+                for field, label in (('genres', 'Genres'), ('moods', 'Moods'), ('time_periods', 'Period'))
+                if tags.get(field)
+            )
+            year = f" ({movie['year']})" if movie['year'] else ""
+            lines.append(f"- {movie['title']}{year} | {tag_text} | {movie['synopsis']}")
+
+        return "\n".join(lines)
+
+    def _create_group_prompt(self, analysis: Dict, shortlist: Optional[List[Dict]] = None) -> str:
         """Create prompt for group recommendations"""
 
         # Get top preferences
@@ -161,6 +345,15 @@ class MovieRecommendationEngine:
         top_periods = list(analysis['time_periods'].keys())[:3]
         top_markers = list(analysis['quality_markers'].keys())[:3]
 
+        if shortlist:
+            catalog_section = f"Films the club can show:\n\n{self._format_shortlist(shortlist)}\n\n"
+            mood_picks = "One mood-based recommendation"
+            movie_details = SHORTLIST_MOVIE_DETAILS
+        else:
+            catalog_section = ""
+            mood_picks = "Three mood-based recommendations"
+            movie_details = FULL_MOVIE_DETAILS
+
         prompt = f"""You are a friendly and knowledgeable film expert. Based on these group preferences:
 
 Top Genres: {', '.join(top_genres)}
@@ -168,28 +361,38 @@ Top Moods: {', '.join(top_moods)}
 Preferred Time Periods: {', '.join(top_periods)}
 Quality Markers: {', '.join(top_markers)}
 
-Please recommend movies in these categories:
+{catalog_section}Please recommend movies in these categories:
 
 1. Five "Must-Watch" films that would appeal to the whole group
-2. Three mood-based recommendations for each of the top 3 moods
+2. {mood_picks} for each of the top 3 moods
 3. Three "Discovery" picks that could expand the group's horizons while still being enjoyable
 
-For each movie, include:
-- **Title and Year**
-- **Genres**
-- **Brief Description**
-- **Match Score (0-100)**
-- **Selling Points** (bullet list of 3 items)
-- **Explanation** of why it's recommended
+{movie_details}
 
 Provide the recommendations formatted in Markdown with clear headings, subheadings, and bullet points. Do not include any additional text or explanations outside the Markdown content.
 """
 
         return prompt
 
-    def _create_personal_prompt(self, preferences: Dict) -> str:
+    def _create_personal_prompt(
+        self,
+        preferences: Dict,
+        similar_members: Optional[List[Dict]] = None,
+        shortlist: Optional[List[Dict]] = None
+    ) -> str:
         """Create prompt for personal recommendations"""
 
+        # Options chosen by members with similar taste, when available
+        similar_taste = self._summarize_similar_members(similar_members or [])
+        similar_line = f"Members With Similar Taste Also Enjoy: {', '.join(similar_taste)}" if similar_taste else ""
+
+        if shortlist:
+            catalog_section = f"Films the club can show:\n\n{self._format_shortlist(shortlist)}\n\n"
+            movie_details = SHORTLIST_MOVIE_DETAILS
+        else:
+            catalog_section = ""
+            movie_details = FULL_MOVIE_DETAILS
+
         prompt = f"""You are a friendly and knowledgeable film expert. Based on these user preferences:
 
 Favorite Genres: {', '.join(preferences.get('genres', []))}
@@ -197,26 +400,32 @@ Preferred Moods: {', '.join(preferences.get('moods', []))}
 Time Periods: {', '.join(preferences.get('time_periods', []))}
 Quality Markers: {', '.join(preferences.get('quality_markers', []))}
 Languages: {', '.join(preferences.get('languages', []))}
+{similar_line}
 
-Please recommend movies in these categories:
+{catalog_section}Please recommend movies in these categories:
 
 1. Three perfect matches based on these preferences
 2. Three personal picks you think this person would especially enjoy
 3. Three "bridge" picks that could help them explore new genres/styles while still being enjoyable
 
-For each movie, include:
-- **Title and Year**
-- **Genres**
-- **Brief Description**
-- **Match Score (0-100)**
-- **Selling Points** (bullet list of 3 items)
-- **Explanation** of why it's recommended
+{movie_details}
 
 Provide the recommendations formatted in Markdown with clear headings, subheadings, and bullet points. Do not include any additional text or explanations outside the Markdown content.
 """
 
         return prompt
 
+    def _summarize_similar_members(self, similar_members: List[Dict], limit: int = 8) -> List[str]:
+        """Rank options picked by similar members that the user hasn't chosen"""
+
+        weights = {}
+        for member in similar_members:
+            for options in member.get('new_options', {}).values():
+                for option in options:
+                    weights[option] = weights.get(option, 0) + member.get('similarity', 0)
+
+        return [option for option, _ in sorted(weights.items(), key=lambda x: x[1], reverse=True)[:limit]]
+
     def _extract_markdown(self, text: str) -> Optional[str]:
         """Extract Markdown content from text."""
         try:
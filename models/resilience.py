@@ -0,0 +1,118 @@
+# resilience.py
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is refusing calls"""
+
+
+class CircuitBreaker:
+    """Stops calling a failing upstream service until it has had time to recover.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are refused for reset_timeout seconds. The first call after that is let
+    through as a trial: success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may be made now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Circuit opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+
+class BackgroundRefresher:
+    """Runs background refreshes one at a time per slot, keeping only the newest request.
+
+    Each slot (e.g. a recommendation weighting) has at most one refresh
+    running and one pending. A request with a new version replaces the
+    pending one, whose future is cancelled, so superseded work never reaches
+    the upstream service.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="refresh")
+        self._running: Dict[str, Tuple[str, Future]] = {}
+        self._pending: Dict[str, Tuple[str, Future, Callable, tuple, dict]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, slot: str, version: str, fn: Callable, *args, **kwargs) -> Future:
+        """Request a refresh of slot at version; returns its future, shared with identical requests"""
+        with self._lock:
+            running = self._running.get(slot)
+            if running is not None and running[0] == version:
+                return running[1]
+
+            pending = self._pending.get(slot)
+            if pending is not None:
+                if pending[0] == version:
+                    return pending[1]
+                pending[1].cancel()
+
+            future = Future()
+            if running is None:
+                self._running[slot] = (version, future)
+                self._executor.submit(self._drain, slot, (version, future, fn, args, kwargs))
+            else:
+                self._pending[slot] = (version, future, fn, args, kwargs)
+            return future
+
+    def _drain(self, slot: str, work: Tuple[str, Future, Callable, tuple, dict]) -> None:
+        """Run a refresh, then the slot's newest pending one, until none is left"""
+        while True:
+            _, future, fn, args, kwargs = work
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            with self._lock:
+                work = self._pending.pop(slot, None)
+                if work is None:
+                    del self._running[slot]
+                    return
+                self._running[slot] = (work[0], work[1])
@@ -0,0 +1,471 @@
+# load_test.py
+"""Concurrent-session load test for the Streamlit app.
+
+Starts one `streamlit run app.py` server and drives N simulated members
+against it over Streamlit's websocket protocol, the way browsers do, so the
+sessions share the server's caches, background refresher and GIL exactly as
+they would in production. The server uses a fake Anthropic client with
+configurable latency and error rate, and either a local mongod or an
+in-process mongomock database.
+
+Sessions connect in steps while the server's memory is sampled, then all of
+them run a weighted mix of submit, analysis and recommendation visits.
+Reports rerun latency percentiles, throughput and the server's RSS against
+the number of connected sessions.
+
+    python scripts/load_test.py --sessions 20 --duration 60
+    python scripts/load_test.py --sessions 100 --ramp-step 20 --llm-latency 8
+    python scripts/load_test.py --sessions 20 --mongomock
+
+Widget values are sent the way current Streamlit frontends serialize them.
+The harness writes test members into the movie_preferences database, so point
+--mongo-uri at a throwaway mongod.
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+from unittest import mock
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import anthropic
+try:
+    import httpx
+except ImportError:  # Newer Anthropic SDKs ship their HTTP client as httpx2
+    import httpx2 as httpx
+import pymongo
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.MultiSelect_pb2 import MultiSelect
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+PAGES = {
+    "submit": "Submit Preferences",
+    "analysis": "View Analysis",
+    "recommendations": "Get Recommendations"
+}
+
+# Options used for seeded members, a subset of the app's own
+SEED_OPTIONS = {
+    "genres": ["Science Fiction", "Crime Drama", "Mystery", "Documentary", "Fantasy", "Animated"],
+    "time_periods": ["Present Day", "Mid-20th Century", "Future"],
+    "languages": ["Swedish", "English", "Other Languages"],
+    "quality_markers": ["Cult Classic", "Hidden Gem", "Critically Acclaimed"],
+    "moods": ["Thrilling", "Feel-good", "Philosophical", "Mysterious", "Cozy", "Nostalgic"]
+}
+
+# Widgets the sessions read back from each run, by element type
+WIDGET_TYPES = ("radio", "text_input", "multiselect", "button")
+
+FAKE_RECOMMENDATIONS = """## Must-Watch
+
+- **Alien (1979)** · Match Score: 92
+  A tense, atmospheric classic the whole group can agree on.
+"""
+
+FAKE_REQUEST = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+
+def simulated_upstream_error() -> Exception:
+    """A transient API error of the kinds the engine retries"""
+    status_code = random.choice([None, 429, 500, 529])
+    if status_code is None:
+        return anthropic.APIConnectionError(request=FAKE_REQUEST)
+    response = httpx.Response(status_code, request=FAKE_REQUEST)
+    return anthropic.APIStatusError(f"Simulated {status_code}", response=response, body=None)
+
+
+class FakeMessages:
+    """Stand-in for client.messages that sleeps instead of calling the API"""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def create(self, timeout: Optional[float] = None, **kwargs):
+        delay = max(0.0, random.gauss(self.latency, self.jitter))
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise anthropic.APITimeoutError(request=FAKE_REQUEST)
+        time.sleep(delay)
+        if random.random() < self.error_rate:
+            raise simulated_upstream_error()
+        return SimpleNamespace(content=[SimpleNamespace(text=FAKE_RECOMMENDATIONS)])
+
+
+class FakeAnthropic:
+    """Fake Anthropic client with configurable latency and error rate"""
+
+    latency = 2.0
+    jitter = 0.5
+    error_rate = 0.0
+
+    def __init__(self, api_key: Optional[str] = None, **kwargs):
+        self.messages = FakeMessages(self.latency, self.jitter, self.error_rate)
+
+
+def random_preference(options: Dict[str, List[str]], timestamp: datetime) -> Dict:
+    """Build a random but complete preference document"""
+    preference = {"name": f"Member {random.randint(1, 10**6)}", "timestamp": timestamp}
+    for field, values in options.items():
+        preference[field] = random.sample(values, random.randint(1, min(3, len(values))))
+    return preference
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Current resident set size of a process, via ps (Linux and macOS)"""
+    try:
+        output = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True, check=True).stdout
+        return int(output.strip()) * 1024
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def serve(args: argparse.Namespace) -> None:
+    """Run the app server with the fake Anthropic client (the --serve child process)"""
+
+    import models.recommendation_engine as recommendation_engine
+    from streamlit.web import cli as stcli
+
+    FakeAnthropic.latency = args.llm_latency
+    FakeAnthropic.jitter = args.llm_jitter
+    FakeAnthropic.error_rate = args.llm_error_rate
+    mock.patch.object(recommendation_engine, "Anthropic", FakeAnthropic).start()
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+        # The app creates its own MongoClient; hand it this seeded in-memory one
+        mock.patch.object(pymongo, "MongoClient", lambda *a, **kw: client).start()
+    else:
+        client = pymongo.MongoClient(args.mongo_uri)
+        # The app reads MONGODB_URI itself; load_dotenv() won't override it
+        os.environ["MONGODB_URI"] = args.mongo_uri
+
+    # Seed the club with members spread over the last year
+    now = datetime.now()
+    if args.seed_members:
+        client.movie_preferences.preferences.insert_many([
+            random_preference(SEED_OPTIONS, now - timedelta(days=random.uniform(0, 365)))
+            for _ in range(args.seed_members)
+        ])
+
+    os.chdir(REPO_ROOT)  # The app resolves relative paths (CSS, logo) from the repository root
+    sys.argv = [
+        "streamlit", "run", os.path.join(REPO_ROOT, "app.py"),
+        "--server.address=127.0.0.1",
+        f"--server.port={args.port}",
+        "--server.headless=true",
+        "--server.fileWatcherType=none",
+        "--browser.gatherUsageStats=false"
+    ]
+    stcli.main()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port: int, server: subprocess.Popen, timeout: float) -> bool:
+    """Poll the server's health endpoint until it answers or the process exits"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and server.poll() is None:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+class SessionDriver:
+    """One simulated member clicking through the app over its own websocket"""
+
+    def __init__(self, url: str, mix: Dict[str, float], think_time: float, timeout: float):
+        self.url = url
+        self.mix = mix
+        self.think_time = think_time
+        self.timeout = timeout
+        self.page = PAGES["submit"]
+        self.widgets: Dict[str, object] = {}
+        self.latencies: Dict[str, List[float]] = {action: [] for action in mix}
+        self.errors = 0
+        self.websocket = None
+        self._run_failed = False
+
+    async def connect(self) -> None:
+        """Open the session and wait for its first run, like a browser tab loading the app"""
+        self.websocket = await websockets.connect(self.url, max_size=None)
+        await self._rerun([])
+
+    async def close(self) -> None:
+        if self.websocket is not None:
+            await self.websocket.close()
+
+    async def _rerun(self, widget_states: List[WidgetState]) -> float:
+        """Ask the server to rerun the script and wait until it finishes; returns the elapsed seconds"""
+
+        message = BackMsg()
+        message.rerun_script.widget_states.widgets.extend(widget_states)
+        self.widgets = {}
+        self._run_failed = False
+
+        started = time.perf_counter()
+        await self.websocket.send(message.SerializeToString())
+        while True:
+            remaining = started + self.timeout - time.perf_counter()
+            response = ForwardMsg()
+            response.ParseFromString(await asyncio.wait_for(self.websocket.recv(), remaining))
+
+            kind = response.WhichOneof("type")
+            if kind == "delta" and response.delta.WhichOneof("type") == "new_element":
+                self._record_element(response.delta.new_element)
+            elif kind == "script_finished":
+                # st.rerun() ends a run early and starts another; wait for the last one
+                if response.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                if response.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    self._run_failed = True
+                return time.perf_counter() - started
+
+    def _record_element(self, element) -> None:
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            self._run_failed = True
+        elif kind in WIDGET_TYPES:
+            widget = getattr(element, kind)
+            self.widgets[widget.label] = widget
+
+    def _navigation(self) -> WidgetState:
+        return WidgetState(id=self.widgets["Navigation"].id, string_value=self.page)
+
+    async def _timed_rerun(self, action: str, widget_states: List[WidgetState]) -> None:
+        self.latencies[action].append(await self._rerun(widget_states))
+        if self._run_failed:
+            self.errors += 1
+
+    async def _submit(self) -> None:
+        if self.page != PAGES["submit"]:
+            self.page = PAGES["submit"]
+            await self._rerun([self._navigation()])
+
+        # Fill in the whole form and press its submit button in one rerun, as the browser does
+        states = [
+            self._navigation(),
+            WidgetState(id=self.widgets["Your Name"].id, string_value=f"Load Test {random.randint(1, 10**6)}")
+        ]
+        for widget in self.widgets.values():
+            if isinstance(widget, MultiSelect):
+                state = WidgetState(id=widget.id)
+                state.string_array_value.data.extend(
+                    random.sample(list(widget.options), random.randint(1, min(3, len(widget.options))))
+                )
+                states.append(state)
+        states.append(WidgetState(id=self.widgets["Submit Preferences"].id, trigger_value=True))
+        await self._timed_rerun("submit", states)
+
+    async def _visit(self, action: str) -> None:
+        self.page = PAGES[action]
+        await self._timed_rerun(action, [self._navigation()])
+
+    async def visit_every_page(self) -> None:
+        for action in PAGES:
+            self.page = PAGES[action]
+            await self._rerun([self._navigation()])
+
+    async def run_until(self, deadline: float) -> None:
+        actions = list(self.mix)
+        weights = [self.mix[action] for action in actions]
+        while time.monotonic() < deadline:
+            action = random.choices(actions, weights)[0]
+            try:
+                if action == "submit":
+                    await self._submit()
+                else:
+                    await self._visit(action)
+            except websockets.ConnectionClosed:
+                self.errors += 1
+                return
+            except Exception:
+                self.errors += 1
+            await asyncio.sleep(random.expovariate(1 / self.think_time) if self.think_time > 0 else 0)
+
+
+async def run_load(args: argparse.Namespace, url: str, server_pid: int) -> Tuple[List[SessionDriver], List[Tuple[int, Optional[int]]], Optional[int], float]:
+    """Warm up, ramp sessions up while sampling server memory, then run the page mix"""
+
+    # One throwaway session loads every page, so imports and caches aren't charged to the sessions
+    warm_up = SessionDriver(url, args.mix, args.think_time, args.timeout)
+    await warm_up.connect()
+    await warm_up.visit_every_page()
+    await warm_up.close()
+
+    sessions: List[SessionDriver] = []
+    memory = [(0, rss_bytes(server_pid))]
+    while len(sessions) < args.sessions:
+        step = [
+            SessionDriver(url, args.mix, args.think_time, args.timeout)
+            for _ in range(min(args.ramp_step, args.sessions - len(sessions)))
+        ]
+        results = await asyncio.gather(*(session.connect() for session in step), return_exceptions=True)
+        failed = sum(isinstance(result, BaseException) for result in results)
+        if failed:
+            print(f"{failed} of {len(step)} sessions failed to connect", file=sys.stderr)
+        sessions.extend(session for session, result in zip(step, results) if not isinstance(result, BaseException))
+        memory.append((len(sessions), rss_bytes(server_pid)))
+        if failed:
+            break
+
+    peak = memory[-1][1]
+
+    async def sample_peak(deadline: float) -> None:
+        nonlocal peak
+        while time.monotonic() < deadline:
+            await asyncio.sleep(1.0)
+            rss = rss_bytes(server_pid)
+            if rss is not None and (peak is None or rss > peak):
+                peak = rss
+
+    started = time.monotonic()
+    deadline = started + args.duration
+    await asyncio.gather(sample_peak(deadline), *(session.run_until(deadline) for session in sessions))
+    elapsed = time.monotonic() - started
+
+    await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+    return sessions, memory, peak, elapsed
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse 'submit=1,analysis=3,recommendations=1' into action weights"""
+    mix = {}
+    for part in value.split(","):
+        action, _, weight = part.partition("=")
+        if action not in PAGES:
+            raise argparse.ArgumentTypeError(f"Unknown action: {action}")
+        mix[action] = float(weight or 1)
+    return mix
+
+
+def report(args: argparse.Namespace, sessions: List[SessionDriver], memory: List[Tuple[int, Optional[int]]], peak: Optional[int], elapsed: float) -> None:
+    all_latencies = []
+    print(f"\n{len(sessions)}/{args.sessions} sessions on one server, {elapsed:.1f}s, "
+          f"fake Claude latency {args.llm_latency:.1f}s, error rate {args.llm_error_rate:.0%}\n")
+    print(f"{'action':<16}{'reruns':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for action in args.mix:
+        latencies = [value for session in sessions for value in session.latencies[action]]
+        all_latencies.extend(latencies)
+        if latencies:
+            print(f"{action:<16}{len(latencies):>8}"
+                  f"{percentile(latencies, 50) * 1000:>10.0f}"
+                  f"{percentile(latencies, 95) * 1000:>10.0f}"
+                  f"{percentile(latencies, 99) * 1000:>10.0f}")
+
+    if all_latencies:
+        print(f"{'all':<16}{len(all_latencies):>8}"
+              f"{percentile(all_latencies, 50) * 1000:>10.0f}"
+              f"{percentile(all_latencies, 95) * 1000:>10.0f}"
+              f"{percentile(all_latencies, 99) * 1000:>10.0f}")
+
+    print(f"\nThroughput: {len(all_latencies) / elapsed:.2f} reruns/s")
+    print(f"Errors: {sum(session.errors for session in sessions)}")
+
+    if memory[0][1] is None:
+        print("\nServer memory: unavailable (needs ps)")
+        return
+    print(f"\n{'sessions':>8}{'server RSS MiB':>16}")
+    for count, rss in memory:
+        print(f"{count:>8}{rss / 2**20:>16.1f}")
+    if peak is not None:
+        print(f"{'peak':>8}{peak / 2**20:>16.1f}")
+    count, rss = memory[-1]
+    if count:
+        print(f"\nMemory per session (RSS growth after warm-up / sessions): {(rss - memory[0][1]) / count / 2**20:.2f} MiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test one app server with concurrent simulated sessions")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent simulated members")
+    parser.add_argument("--ramp-step", type=int, default=10, help="Sessions connected per step while sampling server memory")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run once every session is connected")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("submit=1,analysis=3,recommendations=1"),
+                        help="Weighted page mix, e.g. submit=1,analysis=3,recommendations=1")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between actions in seconds")
+    parser.add_argument("--seed-members", type=int, default=200, help="Preferences inserted before the run")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017",
+                        help="Local mongod for the server (writes to movie_preferences)")
+    parser.add_argument("--mongomock", action="store_true",
+                        help="Use an in-memory mongomock database inside the server instead of --mongo-uri")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Mean fake Claude latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="Std. deviation of fake Claude latency")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0,
+                        help="Fraction of fake Claude calls that fail with a transient (retryable) error")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-rerun timeout in seconds")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    if not args.mongomock:
+        client = pymongo.MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000)
+        try:
+            client.admin.command("ping")
+        except pymongo.errors.PyMongoError as e:
+            sys.exit(f"Cannot reach mongod at {args.mongo_uri}: {e}")
+
+    port = free_port()
+    log = tempfile.NamedTemporaryFile(prefix="load_test_server_", suffix=".log", delete=False)
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--serve", "--port", str(port)],
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+    try:
+        if not wait_for_server(port, server, timeout=60):
+            sys.exit(f"The app server did not start; see {log.name}")
+        sessions, memory, peak, elapsed = asyncio.run(
+            run_load(args, f"ws://127.0.0.1:{port}/_stcore/stream", server.pid)
+        )
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    if not sessions:
+        sys.exit(f"No session connected; see {log.name}")
+    report(args, sessions, memory, peak, elapsed)
+    print(f"Server log: {log.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# test_batch_jobs.py
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+
+from models.batch_jobs import RecommendationBatchJob, group_requests, personal_requests
+from models.recommendation_engine import MovieRecommendationEngine
+from utils.preferences import convert_objectid_and_datetime, hash_preferences
+
+
+class FakeBatches:
+    """Fake messages.batches: records creates and replays scripted results"""
+
+    def __init__(self, results=None, polls_until_ended=1):
+        self.results_by_batch = {}
+        self.scripted_results = results
+        self.polls_until_ended = polls_until_ended
+        self.created = []
+        self.polls = 0
+
+    def create(self, requests):
+        self.created.append(requests)
+        batch_id = f"batch_{len(self.created)}"
+        self.results_by_batch[batch_id] = self.scripted_results or [
+            succeeded(request["custom_id"], f"## Picks for {request['custom_id']}") for request in requests
+        ]
+        return SimpleNamespace(id=batch_id)
+
+    def retrieve(self, batch_id):
+        self.polls += 1
+        status = "ended" if self.polls >= self.polls_until_ended else "in_progress"
+        return SimpleNamespace(id=batch_id, processing_status=status)
+
+    def results(self, batch_id):
+        return iter(self.results_by_batch[batch_id])
+
+
+class FakeAnthropic:
+    def __init__(self, batches):
+        self.messages = SimpleNamespace(batches=batches)
+
+    def with_options(self, **kwargs):
+        return self
+
+
+def succeeded(custom_id, text):
+    message = SimpleNamespace(content=[SimpleNamespace(text=text)])
+    return SimpleNamespace(custom_id=custom_id, result=SimpleNamespace(type="succeeded", message=message))
+
+
+def errored(custom_id):
+    return SimpleNamespace(custom_id=custom_id, result=SimpleNamespace(type="errored", error="overloaded"))
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient().movie_preferences
+    db.preferences.insert_many([
+        {"name": "Ann", "genres": ["Mystery"], "moods": ["Cozy"]},
+        {"name": "Bo", "genres": ["Science Fiction"], "moods": ["Thrilling"]}
+    ])
+    return db
+
+
+def make_job(db, batches):
+    engine = MovieRecommendationEngine(anthropic_api_key="test")
+    engine.anthropic = FakeAnthropic(batches)
+    return engine, RecommendationBatchJob(engine, db, "personal-movie_preferences", poll_interval=0)
+
+
+def test_fresh_run_submits_once_and_stores_results(db):
+    batches = FakeBatches(polls_until_ended=3)
+    engine, job = make_job(db, batches)
+
+    summary = job.run(lambda: personal_requests(engine, db), lambda custom_id: (db.recommendations, custom_id))
+
+    assert len(batches.created) == 1
+    assert summary == {"batch_id": "batch_1", "succeeded": 2, "failed": 0}
+    assert db.recommendations.count_documents({"batch_id": "batch_1", "markdown": {"$exists": True}}) == 2
+    assert db.batch_jobs.find_one({"_id": "personal-movie_preferences"})["status"] == "completed"
+
+
+def test_interrupted_job_resumes_stored_batch(db):
+    batches = FakeBatches()
+    engine, job = make_job(db, batches)
+    batches.results_by_batch["batch_0"] = [succeeded("personal-1", "## Resumed")]
+    db.batch_jobs.insert_one({"_id": "personal-movie_preferences", "batch_id": "batch_0", "status": "submitted"})
+
+    def build_requests():
+        raise AssertionError("a resumed job must not build or submit a new batch")
+
+    summary = job.run(build_requests, lambda custom_id: (db.recommendations, custom_id))
+
+    assert batches.created == []
+    assert summary["batch_id"] == "batch_0"
+    assert db.recommendations.find_one({"_id": "personal-1"})["markdown"] == "## Resumed"
+
+
+def test_collecting_twice_is_idempotent(db):
+    batches = FakeBatches()
+    engine, job = make_job(db, batches)
+    job.run(lambda: personal_requests(engine, db), lambda custom_id: (db.recommendations, custom_id))
+
+    # Simulate a crash after collecting but before the job was marked completed
+    db.batch_jobs.update_one({}, {"$set": {"status": "submitted"}})
+    job.run(lambda: personal_requests(engine, db), lambda custom_id: (db.recommendations, custom_id))
+
+    assert len(batches.created) == 1
+    assert db.recommendations.count_documents({}) == 2
+
+
+def test_errored_entry_keeps_existing_result(db):
+    batches = FakeBatches(results=[errored("personal-1"), succeeded("personal-2", "## New")])
+    _, job = make_job(db, batches)
+    db.recommendations.insert_one({"_id": "personal-1", "markdown": "## Previous", "batch_id": "old"})
+
+    summary = job.run(
+        lambda: [{"custom_id": "personal-1", "params": {}}, {"custom_id": "personal-2", "params": {}}],
+        lambda custom_id: (db.recommendations, custom_id)
+    )
+
+    assert summary["succeeded"] == 1 and summary["failed"] == 1
+    assert db.recommendations.find_one({"_id": "personal-1"}) == {
+        "_id": "personal-1", "markdown": "## Previous", "batch_id": "old"
+    }
+    assert db.recommendations.find_one({"_id": "personal-2"})["markdown"] == "## New"
+
+
+def run_group_job(db, batches):
+    engine, job = make_job(db, batches)
+    job.job_id = "group-movie_preferences"
+    return job.run(
+        lambda: group_requests(engine, db.client, ["movie_preferences"], None),
+        lambda custom_id: (db.recommendations, "group-equal")
+    )
+
+
+def app_preferences_key(db):
+    return hash_preferences(convert_objectid_and_datetime(list(db.preferences.find())))
+
+
+def test_group_result_carries_the_apps_preferences_key(db):
+    batches = FakeBatches()
+
+    summary = run_group_job(db, batches)
+
+    assert "preferences_key" not in batches.created[0][0]
+    document = db.recommendations.find_one({"_id": "group-equal"})
+    assert summary["succeeded"] == 1
+    assert document["markdown"] == "## Picks for group-movie_preferences"
+    assert document["preferences_key"] == document["requested_key"] == app_preferences_key(db)
+
+
+def test_group_result_replaces_an_older_request(db):
+    db.recommendations.insert_one({
+        "_id": "group-equal", "markdown": "## Old", "preferences_key": "old",
+        "requested_key": "old", "requested_at": datetime.now() - timedelta(hours=1)
+    })
+
+    run_group_job(db, FakeBatches())
+
+    document = db.recommendations.find_one({"_id": "group-equal"})
+    assert document["markdown"] == "## Picks for group-movie_preferences"
+    assert document["requested_key"] == app_preferences_key(db)
+
+
+def test_group_result_skipped_when_newer_preferences_were_requested(db):
+    live = {
+        "_id": "group-equal", "markdown": "## Live", "preferences_key": "newer",
+        "requested_key": "newer", "requested_at": datetime.now().replace(microsecond=0) + timedelta(hours=1)
+    }
+    db.recommendations.insert_one(live)
+
+    summary = run_group_job(db, FakeBatches())
+
+    assert summary["succeeded"] == 1
+    assert db.recommendations.find_one({"_id": "group-equal"}) == live
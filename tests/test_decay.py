@@ -0,0 +1,109 @@
+# test_decay.py
+
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+from utils.decay import MODEL_ID, DecayedPreferenceModel, load_preference_model, record_submission
+
+HALF_LIFE = 10.0
+NOW = datetime.now().replace(microsecond=0)
+
+
+def submission(genres, days_ago, **fields):
+    return {"genres": genres, "moods": ["Cozy"], "timestamp": NOW - timedelta(days=days_ago), **fields}
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().movie_preferences
+
+
+def test_add_decays_older_submissions():
+    model = DecayedPreferenceModel(half_life_days=HALF_LIFE)
+    model.add(submission(["Mystery"], days_ago=HALF_LIFE))
+    model.add(submission(["Fantasy"], days_ago=0))
+
+    counts = model.weighted_counts(now=NOW)
+    assert counts["genres"] == pytest.approx({"Mystery": 0.5, "Fantasy": 1.0})
+    assert counts["moods"] == pytest.approx({"Cozy": 1.5})
+    assert model.effective_members(now=NOW + timedelta(days=HALF_LIFE)) == pytest.approx(0.75)
+
+
+def test_late_arriving_submission_matches_in_order_history():
+    older, newer = submission(["Mystery"], days_ago=15), submission(["Fantasy"], days_ago=2)
+    in_order = DecayedPreferenceModel.from_history([newer, older], HALF_LIFE)
+
+    late = DecayedPreferenceModel(half_life_days=HALF_LIFE)
+    late.add(newer)
+    late.add(older)
+
+    assert late.weighted_counts(now=NOW)["genres"] == pytest.approx(in_order.weighted_counts(now=NOW)["genres"])
+    assert late.updated_at == newer["timestamp"]
+
+
+def test_analysis_reports_decayed_percentages():
+    model = DecayedPreferenceModel.from_history(
+        [submission(["Mystery"], days_ago=HALF_LIFE), submission(["Fantasy", "Mystery"], days_ago=0)],
+        HALF_LIFE
+    )
+
+    analysis = model.analysis()
+
+    assert analysis["genres"] == pytest.approx({"Mystery": 100.0, "Fantasy": 100 / 1.5})
+    assert list(analysis["genres"]) == ["Mystery", "Fantasy"]
+    assert analysis["total_users"] == 2
+
+
+def test_recorded_submissions_match_a_rebuild(db):
+    db.preferences.insert_many([submission(["Mystery"], days_ago=30), submission(["Fantasy"], days_ago=20)])
+    load_preference_model(db, HALF_LIFE)
+
+    for genres in (["Animated"], ["Mystery", "Animated"]):
+        preference = submission(genres, days_ago=0)
+        db.preferences.insert_one(preference)
+        record_submission(db, preference, HALF_LIFE)
+
+    stored = load_preference_model(db, HALF_LIFE)
+    rebuilt = DecayedPreferenceModel.from_history(db.preferences.find(), HALF_LIFE)
+    assert stored.submissions == rebuilt.submissions == 4
+    assert stored.weighted_counts(now=NOW)["genres"] == pytest.approx(rebuilt.weighted_counts(now=NOW)["genres"])
+
+
+def test_submission_included_by_a_rebuild_is_not_recorded_twice(db):
+    db.preferences.insert_one(submission(["Mystery"], days_ago=5))
+    load_preference_model(db, HALF_LIFE)
+
+    # Another session's page load rebuilds between this session's insert and its record_submission
+    preference = submission(["Fantasy"], days_ago=0)
+    db.preferences.insert_one(preference)
+    load_preference_model(db, HALF_LIFE)
+    record_submission(db, preference, HALF_LIFE)
+
+    document = db.preference_model.find_one({"_id": MODEL_ID})
+    assert document["submissions"] == 2
+    assert document["counters"]["genres"]["Fantasy"] == pytest.approx(1.0)
+
+
+def test_rebuild_does_not_overwrite_a_newer_recorded_model(db, monkeypatch):
+    db.preferences.insert_one(submission(["Mystery"], days_ago=5))
+    load_preference_model(db, HALF_LIFE)
+    preference = submission(["Fantasy"], days_ago=0)
+    db.preferences.insert_one(preference)
+    db.preferences.insert_one(submission(["Animated"], days_ago=1))
+
+    # A submission is recorded while a rebuild is scanning history
+    from_history = DecayedPreferenceModel.from_history.__func__
+
+    def racing_from_history(cls, preferences, half_life_days):
+        model = from_history(cls, preferences, half_life_days)
+        record_submission(db, preference, HALF_LIFE)
+        return model
+
+    monkeypatch.setattr(DecayedPreferenceModel, "from_history", classmethod(racing_from_history))
+    rebuilt = load_preference_model(db, HALF_LIFE)
+
+    document = db.preference_model.find_one({"_id": MODEL_ID})
+    assert rebuilt.submissions == 3
+    assert document["submissions"] == 2 and "Animated" not in document["counters"]["genres"]
@@ -0,0 +1,41 @@
+# test_recommendation_engine.py
+
+import pytest
+
+from models.movie_catalog import MovieCatalog
+from models.recommendation_engine import (
+    GROUP_SHORTLIST_PICKS,
+    SHORTLIST_MOVIE_DETAILS,
+    MovieRecommendationEngine
+)
+
+PREFERENCES = [{"genres": ["Mystery"], "moods": ["Cozy"], "time_periods": ["Present Day"], "quality_markers": [], "languages": []}]
+
+
+def catalog_with(tmp_path, count):
+    catalog = MovieCatalog(str(tmp_path / "catalog.db"))
+    catalog.import_movies([
+        {"title": f"Film {i}", "year": 2000 + i, "synopsis": f"Synopsis {i}.", "genres": ["Mystery"]}
+        for i in range(count)
+    ])
+    return catalog
+
+
+def prompt_for(catalog):
+    engine = MovieRecommendationEngine(anthropic_api_key="test", catalog=catalog)
+    return engine.group_message_params(PREFERENCES)["messages"][0]["content"]
+
+
+def test_small_catalog_falls_back_to_open_recommendations(tmp_path):
+    prompt = prompt_for(catalog_with(tmp_path, 2))
+
+    assert "Films the club can show" not in prompt
+    assert "Only recommend films from the list above" not in prompt
+
+
+@pytest.mark.parametrize("count", [GROUP_SHORTLIST_PICKS, 40])
+def test_shortlist_prompt_keeps_descriptions(tmp_path, count):
+    prompt = prompt_for(catalog_with(tmp_path, count))
+
+    assert "Films the club can show" in prompt and "Synopsis 0." in prompt
+    assert SHORTLIST_MOVIE_DETAILS in prompt and "Brief Description" in SHORTLIST_MOVIE_DETAILS
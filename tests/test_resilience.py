@@ -0,0 +1,117 @@
+# test_resilience.py
+
+import threading
+import time
+from types import SimpleNamespace
+
+try:
+    import httpx
+except ImportError:  # Newer Anthropic SDKs ship their HTTP client as httpx2
+    import httpx2 as httpx
+import pytest
+from anthropic import APIConnectionError
+
+from models.recommendation_engine import MovieRecommendationEngine
+from models.resilience import BackgroundRefresher, CircuitBreaker
+
+PREFERENCES = [{"genres": ["Mystery"], "moods": ["Cozy"], "time_periods": [], "quality_markers": [], "languages": []}]
+REQUEST = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+
+class FakeMessages:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return SimpleNamespace(content=[SimpleNamespace(text="## Picks")])
+
+
+def make_engine(outcomes, breaker):
+    engine = MovieRecommendationEngine(anthropic_api_key="test", breaker=breaker)
+    messages = FakeMessages(outcomes)
+    engine.anthropic = SimpleNamespace(messages=messages)
+    return engine, messages
+
+
+def open_breaker(reset_timeout=0.05):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    return breaker
+
+
+def test_exhausted_budget_does_not_claim_half_open_trial():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    engine, messages = make_engine([], breaker)
+
+    result = engine.generate_group_recommendations(PREFERENCES, latency_budget=1e-9)
+
+    assert "error" in result and messages.calls == 0
+    assert breaker.allow()
+
+
+def test_unexpected_exception_releases_half_open_trial():
+    breaker = open_breaker()
+    time.sleep(0.06)
+    engine, _ = make_engine([KeyboardInterrupt()], breaker)
+
+    with pytest.raises(KeyboardInterrupt):
+        engine.generate_group_recommendations(PREFERENCES)
+
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setattr("models.recommendation_engine.BACKOFF_BASE", 0.001)
+    engine, messages = make_engine([APIConnectionError(request=REQUEST)], CircuitBreaker())
+
+    result = engine.generate_group_recommendations(PREFERENCES, latency_budget=5)
+
+    assert result == {"markdown": "## Picks"} and messages.calls == 2
+
+
+def test_open_circuit_fails_fast():
+    engine, messages = make_engine([], open_breaker(reset_timeout=60))
+
+    result = engine.generate_group_recommendations(PREFERENCES)
+
+    assert "temporarily unavailable" in result["error"] and messages.calls == 0
+
+
+def test_refresher_runs_only_newest_pending_request():
+    refresher = BackgroundRefresher()
+    release = threading.Event()
+    calls = []
+
+    def refresh(version):
+        calls.append(version)
+        release.wait(timeout=5)
+        return version
+
+    first = refresher.submit("group-equal", "v1", refresh, "v1")
+    superseded = refresher.submit("group-equal", "v2", refresh, "v2")
+    newest = refresher.submit("group-equal", "v3", refresh, "v3")
+    assert refresher.submit("group-equal", "v3", refresh, "v3") is newest
+
+    release.set()
+    assert first.result(timeout=5) == "v1"
+    assert newest.result(timeout=5) == "v3"
+    assert superseded.cancelled()
+    assert calls == ["v1", "v3"]
+
+
+def test_refresher_slots_are_independent():
+    refresher = BackgroundRefresher()
+
+    equal = refresher.submit("group-equal", "v1", lambda: "equal")
+    decayed = refresher.submit("group-decayed", "v1", lambda: "decayed")
+
+    assert equal.result(timeout=5) == "equal"
+    assert decayed.result(timeout=5) == "decayed"
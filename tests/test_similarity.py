@@ -0,0 +1,116 @@
+# test_similarity.py
+
+import math
+import random
+
+import numpy as np
+import pytest
+
+from utils.similarity import PREFERENCE_FIELDS, PreferenceIndex
+
+OPTIONS = {
+    "genres": [f"Genre {i}" for i in range(40)],
+    "time_periods": ["Present Day", "Mid-20th Century", "Future"],
+    "languages": ["Swedish", "English", "Other Languages"],
+    "quality_markers": ["Cult Classic", "Hidden Gem"],
+    "moods": [f"Mood {i}" for i in range(30)]
+}
+
+
+def random_member(rng, key):
+    member = {"_id": key, "name": f"Member {key}"}
+    for field, values in OPTIONS.items():
+        member[field] = rng.sample(values, rng.randint(0, min(4, len(values))))
+    return member
+
+
+def option_set(preferences):
+    return {(field, value) for field in PREFERENCE_FIELDS for value in preferences.get(field, [])}
+
+
+def brute_force(members, query, metric):
+    query_set = option_set(query)
+    scores = {}
+    for member in members:
+        member_set = option_set(member)
+        shared = len(member_set & query_set)
+        if metric == "jaccard":
+            union = len(member_set | query_set)
+            scores[member["_id"]] = shared / union if union else 0.0
+        else:
+            norm = math.sqrt(len(member_set) * len(query_set))
+            scores[member["_id"]] = shared / norm if norm else 0.0
+    return scores
+
+
+@pytest.fixture
+def members():
+    rng = random.Random(7)
+    return [random_member(rng, f"m{i}") for i in range(300)]
+
+
+def test_encode_decode_round_trip():
+    index = PreferenceIndex(OPTIONS)
+    preferences = {"genres": ["Genre 0", "Genre 39"], "moods": ["Mood 29"], "languages": ["English"]}
+
+    assert index.encode(preferences).shape == (2,)  # 81 options need two 64-bit words
+    assert index._decode(index.encode(preferences)) == {
+        "genres": ["Genre 0", "Genre 39"], "languages": ["English"], "moods": ["Mood 29"]
+    }
+
+
+@pytest.mark.parametrize("metric", ["jaccard", "cosine"])
+def test_query_matches_brute_force(members, metric):
+    index = PreferenceIndex(OPTIONS, initial_capacity=16)
+    for member in members:
+        index.add(member["_id"], member)
+    query = random_member(random.Random(11), "query")
+
+    neighbours = index.query(query, k=10, metric=metric)
+
+    expected = brute_force(members, query, metric)
+    top_scores = sorted((score for score in expected.values() if score > 0), reverse=True)[:10]
+    assert [n["similarity"] for n in neighbours] == pytest.approx(top_scores, rel=1e-6)
+    for neighbour in neighbours:
+        assert neighbour["similarity"] == pytest.approx(expected[neighbour["key"]], rel=1e-6)
+        member = next(m for m in members if m["_id"] == neighbour["key"])
+        new_options = {(field, value) for field, values in neighbour["new_options"].items() for value in values}
+        assert new_options == option_set(member) - option_set(query)
+
+
+def test_build_matches_incremental_adds(members):
+    built = PreferenceIndex(OPTIONS, initial_capacity=16)
+    built.build(iter(members), chunk_size=64)
+    added = PreferenceIndex(OPTIONS, initial_capacity=16)
+    for member in members:
+        added.add(member["_id"], member)
+
+    assert len(built) == len(added) == len(members)
+    assert np.array_equal(built._vectors[:len(members)], added._vectors[:len(members)])
+    assert np.array_equal(built._sizes[:len(members)], added._sizes[:len(members)])
+
+    query = members[0]
+    assert built.query(query, k=5) == added.query(query, k=5)
+
+
+def test_add_replaces_member_in_place():
+    index = PreferenceIndex(OPTIONS)
+    index.add("a", {"name": "Ann", "genres": ["Genre 1"]})
+    index.add("b", {"name": "Bo", "genres": ["Genre 2"]})
+
+    index.add("a", {"name": "Ann", "genres": ["Genre 2"]})
+
+    assert len(index) == 2
+    assert {n["key"] for n in index.query({"genres": ["Genre 2"]}, k=5)} == {"a", "b"}
+    assert index.query({"genres": ["Genre 1"]}, k=5) == []
+
+
+def test_exclude_key_and_name():
+    index = PreferenceIndex(OPTIONS)
+    index.add("old", {"name": "Ann", "genres": ["Genre 1"], "moods": ["Mood 1"]})
+    index.add("other", {"name": "Bo", "genres": ["Genre 1"]})
+    index.add("new", {"name": " ann ", "genres": ["Genre 1"], "moods": ["Mood 1"]})
+    query = {"genres": ["Genre 1"], "moods": ["Mood 1"]}
+
+    assert [n["key"] for n in index.query(query, exclude_key="new")] == ["old", "other"]
+    assert [n["key"] for n in index.query(query, exclude_key="new", exclude_name="Ann")] == ["other"]
@@ -64,6 +64,16 @@ def analyze_preferences(preferences: List[Dict]) -> Dict:
         "trends": daily_counts
     }
 
+def create_weighted_data(weighted_counts: Dict[str, float], label: str, effective_members: float) -> pd.DataFrame:
+    """Build chart data from decayed counts, shaped like the data from analyze_preferences"""
+
+    counts = pd.Series(weighted_counts, dtype=float).sort_values(ascending=False)
+    return pd.DataFrame({
+        label: counts.index,
+        'Count': counts.values.round(1),
+        'Percentage': (counts.values / effective_members * 100).round(1) if effective_members else 0.0
+    })
+
 def create_genre_chart(genre_data: pd.DataFrame) -> go.Figure:
     """Create genre distribution chart"""
 
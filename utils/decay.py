@@ -0,0 +1,188 @@
+# decay.py
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Union
+
+from pymongo.errors import DuplicateKeyError
+
+from utils.similarity import PREFERENCE_FIELDS
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Single model document per club, stored in the preference_model collection
+MODEL_ID = "group"
+
+# IDs of the most recently applied submissions kept in the model, so a submission
+# recorded after a rebuild that already included it isn't counted twice
+APPLIED_IDS_KEPT = 1000
+
+
+def _as_datetime(value: Union[datetime, str, None]) -> datetime:
+    """Accept datetimes or the ISO strings produced for the UI"""
+    if value is None:
+        return datetime.now()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+class DecayedPreferenceModel:
+    """Exponentially decayed option counters for group preferences"""
+
+    def __init__(self, half_life_days: float = 180.0):
+        self.half_life_days = half_life_days
+        self.counters: Dict[str, Dict[str, float]] = {field: {} for field in PREFERENCE_FIELDS}
+        self.total = 0.0
+        self.submissions = 0
+        self.updated_at: Optional[datetime] = None
+        self.applied_ids: List = []
+
+    def _decay_factor(self, elapsed_seconds: float) -> float:
+        return 0.5 ** (elapsed_seconds / (self.half_life_days * SECONDS_PER_DAY))
+
+    def add(self, preference: Dict, timestamp: Union[datetime, str, None] = None) -> None:
+        """Apply one submission in O(options) without rescanning history"""
+
+        timestamp = _as_datetime(timestamp or preference.get('timestamp'))
+
+        if self.updated_at is None or timestamp >= self.updated_at:
+            # Bring existing counters forward to the new submission's time
+            if self.updated_at is not None:
+                decay = self._decay_factor((timestamp - self.updated_at).total_seconds())
+                for counts in self.counters.values():
+                    for option in counts:
+                        counts[option] *= decay
+                self.total *= decay
+            self.updated_at = timestamp
+            weight = 1.0
+        else:
+            # Late-arriving older submission: add it already decayed
+            weight = self._decay_factor((self.updated_at - timestamp).total_seconds())
+
+        for field in PREFERENCE_FIELDS:
+            counts = self.counters[field]
+            for option in preference.get(field, []):
+                counts[option] = counts.get(option, 0.0) + weight
+        self.total += weight
+        self.submissions += 1
+        if "_id" in preference:
+            self.applied_ids.append(preference["_id"])
+            del self.applied_ids[:-APPLIED_IDS_KEPT]
+
+    def weighted_counts(self, now: Optional[datetime] = None) -> Dict[str, Dict[str, float]]:
+        """Decayed counts per option as of now, in effective members"""
+
+        decay = self._now_factor(now)
+        return {
+            field: {option: count * decay for option, count in counts.items()}
+            for field, counts in self.counters.items()
+        }
+
+    def effective_members(self, now: Optional[datetime] = None) -> float:
+        """Decayed number of members as of now"""
+        return self.total * self._now_factor(now)
+
+    def _now_factor(self, now: Optional[datetime]) -> float:
+        if self.updated_at is None:
+            return 0.0
+        elapsed = ((now or datetime.now()) - self.updated_at).total_seconds()
+        return self._decay_factor(max(0.0, elapsed))
+
+    def analysis(self) -> Dict:
+        """Decayed group analysis, shaped like MovieRecommendationEngine._analyze_group_preferences"""
+
+        # Percentages are ratios of counters decayed by the same factor, so they don't depend on "now"
+        analysis = {}
+        for field, counts in self.counters.items():
+            analysis[field] = dict(sorted(
+                {k: (v / self.total) * 100 if self.total else 0.0 for k, v in counts.items()}.items(),
+                key=lambda x: x[1], reverse=True
+            ))
+        analysis["total_users"] = self.submissions
+
+        return analysis
+
+    def to_document(self) -> Dict:
+        return {
+            "_id": MODEL_ID,
+            "half_life_days": self.half_life_days,
+            "counters": self.counters,
+            "total": self.total,
+            "submissions": self.submissions,
+            "updated_at": self.updated_at,
+            "applied_ids": self.applied_ids
+        }
+
+    @classmethod
+    def from_document(cls, document: Dict) -> "DecayedPreferenceModel":
+        model = cls(half_life_days=document["half_life_days"])
+        for field, counts in document.get("counters", {}).items():
+            model.counters[field] = dict(counts)
+        model.total = document.get("total", 0.0)
+        model.submissions = document.get("submissions", 0)
+        model.updated_at = document.get("updated_at")
+        model.applied_ids = list(document.get("applied_ids", []))
+        return model
+
+    @classmethod
+    def from_history(cls, preferences: Iterable[Dict], half_life_days: float) -> "DecayedPreferenceModel":
+        """Build the model from all submissions, oldest first"""
+        model = cls(half_life_days=half_life_days)
+        for preference in sorted(preferences, key=lambda p: _as_datetime(p.get('timestamp'))):
+            model.add(preference)
+        return model
+
+
+def load_preference_model(db, half_life_days: float) -> DecayedPreferenceModel:
+    """Load the stored model, rebuilding it from history when missing or out of date"""
+
+    document = db.preference_model.find_one({"_id": MODEL_ID})
+    if (
+        document is not None
+        and document.get("half_life_days") == half_life_days
+        and document.get("submissions") == db.preferences.estimated_document_count()
+    ):
+        return DecayedPreferenceModel.from_document(document)
+
+    projection = {"timestamp": 1, **{field: 1 for field in PREFERENCE_FIELDS}}
+    model = DecayedPreferenceModel.from_history(db.preferences.find({}, projection), half_life_days)
+
+    # Only replace the version read before the scan; if a submission was recorded
+    # meanwhile, keep the stored model and let a later load reconcile
+    if document is None:
+        try:
+            db.preference_model.insert_one(model.to_document())
+        except DuplicateKeyError:
+            pass
+    else:
+        db.preference_model.replace_one(
+            {"_id": MODEL_ID, "submissions": document.get("submissions")},
+            model.to_document()
+        )
+    return model
+
+
+def record_submission(db, preference: Dict, half_life_days: float, attempts: int = 5) -> None:
+    """Apply a new submission to the stored model with optimistic concurrency"""
+
+    for _ in range(attempts):
+        document = db.preference_model.find_one({"_id": MODEL_ID})
+        if document is None or document.get("half_life_days") != half_life_days:
+            # Nothing to update incrementally; the next load rebuilds from history
+            return
+
+        model = DecayedPreferenceModel.from_document(document)
+        if "_id" in preference and preference["_id"] in model.applied_ids:
+            # Already included, e.g. by a rebuild from history that ran after the insert
+            return
+        model.add(preference)
+
+        # Only replace the version we read; retry if another session got there first
+        result = db.preference_model.replace_one(
+            {"_id": MODEL_ID, "submissions": document["submissions"]},
+            model.to_document()
+        )
+        if result.matched_count:
+            return
+
+    # Give up on the incremental path; the next load sees the stale count and rebuilds
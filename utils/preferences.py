@@ -0,0 +1,28 @@
+# preferences.py
+
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, List
+
+from bson import ObjectId  # Import ObjectId for type checking
+
+
+# Function to hash preferences data
+def hash_preferences(preferences_data: List[Dict]) -> str:
+    """Key identifying a set of converted preference documents"""
+    # Serialize the preferences data to a JSON string with sorted keys for consistency
+    preferences_str = json.dumps(preferences_data, sort_keys=True)
+    # Create a SHA256 hash of the string
+    return hashlib.sha256(preferences_str.encode()).hexdigest()
+
+
+# Function to convert ObjectId and datetime to string
+def convert_objectid_and_datetime(preferences: List[Dict]) -> List[Dict]:
+    """Converts ObjectId and datetime objects to strings in each document."""
+    for pref in preferences:
+        if '_id' in pref and isinstance(pref['_id'], ObjectId):
+            pref['_id'] = str(pref['_id'])
+        if 'timestamp' in pref and isinstance(pref['timestamp'], datetime):
+            pref['timestamp'] = pref['timestamp'].isoformat()
+    return preferences
@@ -0,0 +1,229 @@
+# similarity.py
+
+import threading
+from itertools import chain, islice, repeat
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Preference fields that make up a member's preference vector
+PREFERENCE_FIELDS = ["genres", "time_periods", "languages", "quality_markers", "moods"]
+
+# Bit counts for every byte value, used when numpy lacks bitwise_count (< 2.0)
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount_rows(matrix: np.ndarray) -> np.ndarray:
+    """Count set bits per row of a 2-D uint64 matrix"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(matrix).sum(axis=1, dtype=np.int32)
+    byte_view = np.ascontiguousarray(matrix).view(np.uint8).reshape(len(matrix), -1)
+    return _BYTE_POPCOUNT[byte_view].sum(axis=1, dtype=np.int32)
+
+
+def _resized(array: np.ndarray, capacity: int) -> np.ndarray:
+    """Copy of array with its first dimension grown to capacity, zero-filled"""
+    resized = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    resized[:len(array)] = array
+    return resized
+
+
+def _name_key(name: str) -> str:
+    """Normalize a member name for matching repeat submissions"""
+    return name.strip().casefold()
+
+
+class PreferenceIndex:
+    """Bit-packed index over member preference vectors for "members like me" lookups"""
+
+    def __init__(self, options: Dict[str, Sequence[str]], initial_capacity: int = 1024):
+        # Assign one bit per (field, option) pair
+        self._field_bits: Dict[str, Dict[str, int]] = {field: {} for field in PREFERENCE_FIELDS}
+        self._labels = []
+        for field, values in options.items():
+            for value in values:
+                self._field_bits.setdefault(field, {})[value] = len(self._labels)
+                self._labels.append((field, value))
+
+        self._words = max(1, (len(self._labels) + 63) // 64)
+        self._vectors = np.zeros((initial_capacity, self._words), dtype=np.uint64)
+        self._sizes = np.zeros(initial_capacity, dtype=np.int32)
+        self._keys: List[str] = []
+        self._names: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._rows_by_name: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def encode(self, preferences: Dict) -> np.ndarray:
+        """Encode a preference document as a packed bit vector"""
+        words = [0] * self._words
+        for field in PREFERENCE_FIELDS:
+            for value in preferences.get(field, []):
+                bit = self._field_bits[field].get(value)
+                if bit is not None:
+                    words[bit // 64] |= 1 << (bit % 64)
+        return np.array(words, dtype=np.uint64)
+
+    def _encode_many(self, documents: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Encode many preference documents at once into packed bit vectors and their sizes"""
+
+        # Set every (row, bit) in one fancy-indexing pass per field
+        matrix = np.zeros((len(documents), self._words * 64), dtype=bool)
+        for field in PREFERENCE_FIELDS:
+            values = [document.get(field) or [] for document in documents]
+            lengths = np.fromiter(map(len, values), dtype=np.intp, count=len(values))
+            bits = np.fromiter(
+                map(self._field_bits[field].get, chain.from_iterable(values), repeat(-1)),
+                dtype=np.intp,
+                count=int(lengths.sum())
+            )
+            rows = np.repeat(np.arange(len(documents)), lengths)
+            known = bits >= 0
+            matrix[rows[known], bits[known]] = True
+
+        # Pack eight bits per byte, eight little-endian bytes per word, matching encode()
+        vectors = np.packbits(matrix, axis=1, bitorder="little").view("<u8").astype(np.uint64)
+        return vectors, matrix.sum(axis=1, dtype=np.int32)
+
+    def build(self, documents: Iterable[Dict], chunk_size: int = 65536) -> None:
+        """Replace the index with all members at once, keyed by str(document["_id"])"""
+
+        vectors = np.zeros_like(self._vectors)
+        sizes = np.zeros_like(self._sizes)
+        keys: List[str] = []
+        names: List[str] = []
+
+        # Encode in chunks so a large collection never needs a full bit matrix in memory
+        documents = iter(documents)
+        while True:
+            chunk = list(islice(documents, chunk_size))
+            if not chunk:
+                break
+            count = len(keys)
+            if count + len(chunk) > len(vectors):
+                capacity = max(len(vectors) * 2, count + len(chunk))
+                vectors = _resized(vectors, capacity)
+                sizes = _resized(sizes, capacity)
+            vectors[count:count + len(chunk)], sizes[count:count + len(chunk)] = self._encode_many(chunk)
+            keys.extend(str(document["_id"]) for document in chunk)
+            names.extend(document.get("name", "") for document in chunk)
+
+        rows = {key: row for row, key in enumerate(keys)}
+        rows_by_name: Dict[str, List[int]] = {}
+        # Same as _name_key, without a Python call per member
+        for row, name_key in enumerate(map(str.casefold, map(str.strip, names))):
+            rows_by_name.setdefault(name_key, []).append(row)
+
+        with self._lock:
+            self._vectors = vectors
+            self._sizes = sizes
+            self._keys = keys
+            self._names = names
+            self._rows = rows
+            self._rows_by_name = rows_by_name
+
+    def add(self, key: str, preferences: Dict) -> None:
+        """Insert or replace a member's preference vector"""
+        vector = self.encode(preferences)
+
+        with self._lock:
+            name = preferences.get("name", "")
+            row = self._rows.get(key)
+            if row is None:
+                row = len(self._keys)
+                if row == len(self._vectors):
+                    self._grow()
+                self._rows[key] = row
+                self._keys.append(key)
+                self._names.append(name)
+                self._rows_by_name.setdefault(_name_key(name), []).append(row)
+            else:
+                if _name_key(self._names[row]) != _name_key(name):
+                    self._rows_by_name[_name_key(self._names[row])].remove(row)
+                    self._rows_by_name.setdefault(_name_key(name), []).append(row)
+                self._names[row] = name
+
+            self._vectors[row] = vector
+            self._sizes[row] = _popcount_rows(vector[np.newaxis, :])[0]
+
+    def query(
+        self,
+        preferences: Dict,
+        k: int = 5,
+        metric: str = "jaccard",
+        exclude_key: Optional[str] = None,
+        exclude_name: Optional[str] = None
+    ) -> List[Dict]:
+        """Return the k most similar members and the options they chose that this member didn't.
+
+        exclude_key leaves out one submission; exclude_name leaves out every
+        submission under that name, so members aren't matched with themselves.
+        """
+        if metric not in ("jaccard", "cosine"):
+            raise ValueError(f"Unknown similarity metric: {metric}")
+
+        query = self.encode(preferences)
+        query_size = int(_popcount_rows(query[np.newaxis, :])[0])
+
+        # Copy the populated rows so concurrent inserts and in-place replacements can't affect this query
+        with self._lock:
+            count = len(self._keys)
+            vectors = self._vectors[:count].copy()
+            sizes = self._sizes[:count].copy()
+            keys = self._keys
+            names = self._names
+            exclude_rows = list(self._rows_by_name.get(_name_key(exclude_name), [])) if exclude_name else []
+            if exclude_key in self._rows:
+                exclude_rows.append(self._rows[exclude_key])
+
+        if count == 0 or query_size == 0:
+            return []
+
+        shared = _popcount_rows(vectors & query).astype(np.float32)
+        if metric == "jaccard":
+            denominator = sizes + query_size - shared
+        else:
+            denominator = np.sqrt(sizes.astype(np.float32) * query_size)
+        scores = np.divide(shared, denominator, out=np.zeros_like(shared), where=denominator > 0)
+
+        if exclude_rows:
+            scores[exclude_rows] = -1.0
+
+        # Select the top k without sorting every member
+        k = min(k, count)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        neighbours = []
+        for row in candidates:
+            score = float(scores[row])
+            if score <= 0:
+                break
+            neighbours.append({
+                "key": keys[row],
+                "name": names[row],
+                "similarity": score,
+                "new_options": self._decode(vectors[row] & ~query)
+            })
+
+        return neighbours
+
+    def _decode(self, vector: np.ndarray) -> Dict[str, List[str]]:
+        """Decode a packed bit vector into options grouped by field"""
+        options = {}
+        for word_index, word in enumerate(vector.tolist()):
+            while word:
+                low_bit = word & -word
+                field, value = self._labels[word_index * 64 + low_bit.bit_length() - 1]
+                options.setdefault(field, []).append(value)
+                word ^= low_bit
+        return options
+
+    def _grow(self) -> None:
+        """Double the capacity of the vector storage"""
+        capacity = max(1, len(self._vectors) * 2)
+        self._vectors = _resized(self._vectors, capacity)
+        self._sizes = _resized(self._sizes, capacity)